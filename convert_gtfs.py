@@ -1,7 +1,15 @@
-import csv
-import json
+import hashlib
 import os
 import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
 # Folder names to process
 GTFS_FOLDERS = [
@@ -13,106 +21,179 @@ GTFS_FOLDERS = [
     'bus_routes/gtfs_express'
 ]
 
-def read_csv(filepath):
-    with open(filepath, 'r', encoding='utf-8-sig') as f:
-        return list(csv.DictReader(f))
+# Leading zeros after the route prefix: Q06 -> Q6
+LEADING_ZERO_RE = re.compile(r'^([A-Za-z]+)0+(\d)')
+
+# Columns we actually need from each GTFS file, with the types to parse them as
+TRIPS_COLUMNS = {'shape_id': str, 'route_id': str}
+SHAPES_COLUMNS = {
+    'shape_id': pa.string(),
+    'shape_pt_lat': pa.float32(),
+    'shape_pt_lon': pa.float32(),
+    'shape_pt_sequence': pa.int32()
+}
+# The same columns read as text, for feeds with a malformed number somewhere
+SHAPES_TEXT_COLUMNS = {col: pa.string() for col in SHAPES_COLUMNS}
+
+# Bytes of shapes.txt parsed per batch (~500k rows), to bound peak memory on large feeds
+SHAPES_BLOCK_SIZE = 16 << 20
+
+def read_csv(filepath, columns):
+    return pd.read_csv(
+        filepath,
+        usecols=lambda col: col in columns,  # shape_id is optional in trips.txt
+        dtype=columns,
+        encoding='utf-8-sig',
+        keep_default_na=False
+    )
+
+def read_csv_batches(filepath, columns, block_size):
+    # pyarrow's C++ CSV reader, streamed as record batches. The file is opened
+    # here rather than lazily, so an unreadable file fails at the call site
+    reader = pacsv.open_csv(
+        filepath,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            column_types=columns,
+            include_columns=list(columns),
+            strings_can_be_null=False
+        )
+    )
+    return iter(reader)
+
+def select_shape_points(batch, shape_ids):
+    # Filter a shapes.txt batch down to the wanted shapes in Arrow, so only
+    # those rows are converted to Python objects
+    batch_shape_ids = pc.utf8_trim_whitespace(batch.column('shape_id'))
+    batch = pa.RecordBatch.from_arrays(
+        [batch_shape_ids] + [batch.column(col) for col in list(SHAPES_COLUMNS)[1:]],
+        names=list(SHAPES_COLUMNS)
+    )
+    return batch.filter(pc.is_in(batch_shape_ids, value_set=shape_ids)).to_pandas()
+
+def read_shape_points(shapes_path, shape_ids):
+    """Read the points of the given shapes from shapes.txt, as one DataFrame per batch."""
+    shape_ids = pa.array(shape_ids, pa.string())
+    try:
+        return [
+            select_shape_points(batch, shape_ids).dropna()
+            for batch in read_csv_batches(shapes_path, SHAPES_COLUMNS, SHAPES_BLOCK_SIZE)
+        ]
+    except pa.ArrowInvalid:
+        pass
+
+    # A number somewhere failed to parse. Re-read the file as text and drop only
+    # the rows that don't convert, as the float()/int() failures were before
+    chunks = []
+    for batch in read_csv_batches(shapes_path, SHAPES_TEXT_COLUMNS, SHAPES_BLOCK_SIZE):
+        chunk = select_shape_points(batch, shape_ids)
+        chunk['shape_pt_lat'] = pd.to_numeric(chunk['shape_pt_lat'], errors='coerce').astype(np.float32)
+        chunk['shape_pt_lon'] = pd.to_numeric(chunk['shape_pt_lon'], errors='coerce').astype(np.float32)
+        sequence = pd.to_numeric(chunk['shape_pt_sequence'], errors='coerce')
+        chunk['shape_pt_sequence'] = sequence.where(sequence % 1 == 0)
+        chunks.append(chunk.dropna())
+    return chunks
+
+def process_folder(folder):
+    """Read one borough's GTFS folder and return its distinct shapes per route."""
+    if not os.path.exists(folder):
+        print(f"Warning: folder '{folder}' not found, skipping")
+        return {}
+
+    trips_path = os.path.join(folder, 'trips.txt')
+    shapes_path = os.path.join(folder, 'shapes.txt')
+
+    if not os.path.exists(trips_path) or not os.path.exists(shapes_path):
+        print(f"Warning: missing trips.txt or shapes.txt in '{folder}', skipping")
+        return {}
+
+    if os.path.getsize(shapes_path) == 0:
+        print(f"Warning: shapes.txt in '{folder}' is empty, skipping")
+        return {}
+
+    print(f"Processing {folder}...")
+
+    # Build shape_id -> route_id mapping from trips.txt
+    trips = read_csv(trips_path, TRIPS_COLUMNS)
+    if 'shape_id' not in trips or 'route_id' not in trips:
+        print(f"Warning: trips.txt in '{folder}' has no shape_id or route_id column, skipping")
+        return {}
+    shape_ids = trips['shape_id'].str.strip()
+    route_ids = trips['route_id'].str.strip()
+    keep = (shape_ids != '') & (route_ids != '')
+    shape_ids, route_ids = shape_ids[keep], route_ids[keep]
+    # Clean route_id — MTA sometimes prefixes with agency e.g. "MTA NYCT_M15"
+    route_ids = route_ids.str.rsplit('_', n=1).str[-1]
+    # Skip header row if it bleeds through, and ids left empty by the split
+    keep = (route_ids != 'route_id') & (route_ids != '')
+    shape_ids, route_ids = shape_ids[keep], route_ids[keep]
+    # Normalize SBS routes: M23+ -> M23-SBS (must happen before Bx fix)
+    route_ids = route_ids.mask(route_ids.str.endswith('+'), route_ids.str[:-1] + '-SBS')
+    # Normalize Bx routes: BX26 -> Bx26, BXM1 -> BxM1
+    route_ids = route_ids.mask(route_ids.str.startswith('BX'), 'Bx' + route_ids.str[2:])
+    # Normalize leading zeros: Q06 -> Q6
+    route_ids = route_ids.str.replace(LEADING_ZERO_RE, r'\1\2', regex=True)
+    shape_to_route = dict(zip(shape_ids, route_ids))
+
+    # Stream shapes.txt in chunks, keeping only points for shapes used by a trip,
+    # then order and group all kept points in one pass
+    chunks = read_shape_points(shapes_path, list(shape_to_route))
+    if not chunks:
+        return {}
+    shapes = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    shapes.sort_values(['shape_id', 'shape_pt_sequence'], kind='stable', inplace=True)
+
+    # route_id -> distinct coordinate arrays per route
+    # Some shape_ids repeat the exact same path, so shapes are keyed by a digest
+    # of their coordinates and each distinct path is kept only once
+    route_shapes = defaultdict(dict)  # route_id -> { digest -> float32 array of (lng, lat) rows }
+
+    # Map shapes to routes
+    for shape_id, points in shapes.groupby('shape_id', sort=False):
+        route_id = shape_to_route[shape_id]
+        coords = np.stack([
+            points['shape_pt_lon'].to_numpy(np.float32),
+            points['shape_pt_lat'].to_numpy(np.float32)
+        ], axis=1)
+
+        digest = hashlib.blake2b(coords.tobytes(), digest_size=16).digest()
+        route_shapes[route_id].setdefault(digest, coords)
+
+    return route_shapes
 
 def convert():
-    # route_id -> list of coordinates per shape
-    # We'll collect all shapes per route, then pick the longest one
-    route_shapes = {}  # route_id -> { shape_id -> [(lng, lat), ...] }
-
-    for folder in GTFS_FOLDERS:
-        if not os.path.exists(folder):
-            print(f"Warning: folder '{folder}' not found, skipping")
-            continue
-
-        trips_path = os.path.join(folder, 'trips.txt')
-        shapes_path = os.path.join(folder, 'shapes.txt')
-
-        if not os.path.exists(trips_path) or not os.path.exists(shapes_path):
-            print(f"Warning: missing trips.txt or shapes.txt in '{folder}', skipping")
-            continue
-
-        print(f"Processing {folder}...")
-
-        # Build shape_id -> route_id mapping from trips.txt
-        trips = read_csv(trips_path)
-        shape_to_route = {}
-        for trip in trips:
-            shape_id = trip.get('shape_id', '').strip()
-            route_id = trip.get('route_id', '').strip()
-            if shape_id and route_id:
-                # Clean route_id — MTA sometimes prefixes with agency e.g. "MTA NYCT_M15"
-                route_id = route_id.split('_')[-1] if '_' in route_id else route_id
-                # Skip header row if it bleeds through
-                if route_id == 'route_id':
-                    continue
-                # Normalize SBS routes: M23+ -> M23-SBS (must happen before Bx fix)
-                if route_id.endswith('+'):
-                    route_id = route_id[:-1] + '-SBS'
-                # Normalize Bx routes: BX26 -> Bx26, BXM1 -> BxM1
-                if route_id.startswith('BX'):
-                    route_id = 'Bx' + route_id[2:]
-                # Normalize leading zeros: Q06 -> Q6
-                route_id = re.sub(r'^([A-Za-z]+)0+(\d)', r'\1\2', route_id)
-                shape_to_route[shape_id] = route_id
-
-        # Read shapes.txt and group points by shape_id
-        shapes = read_csv(shapes_path)
-        shape_points = {}  # shape_id -> [(seq, lng, lat)]
-        for row in shapes:
-            shape_id = row.get('shape_id', '').strip()
-            try:
-                lat = float(row['shape_pt_lat'])
-                lng = float(row['shape_pt_lon'])
-                seq = int(row['shape_pt_sequence'])
-            except (ValueError, KeyError):
-                continue
-            if shape_id not in shape_points:
-                shape_points[shape_id] = []
-            shape_points[shape_id].append((seq, lng, lat))
-
-        # Map shapes to routes
-        for shape_id, points in shape_points.items():
-            route_id = shape_to_route.get(shape_id)
-            if not route_id:
-                continue
-
-            # Sort points by sequence
-            points.sort(key=lambda x: x[0])
-            coords = [(lng, lat) for _, lng, lat in points]
-
-            if route_id not in route_shapes:
-                route_shapes[route_id] = {}
-            route_shapes[route_id][shape_id] = coords
-
-    # Build GeoJSON — use MultiLineString to capture all directions
-    features = []
-    for route_id, shapes in route_shapes.items():
-        all_coords = list(shapes.values())
-        features.append({
-            "type": "Feature",
-            "properties": {
-                "route_id": route_id
-            },
-            "geometry": {
-                "type": "MultiLineString",
-                "coordinates": all_coords
-            }
-        })
-
-    geojson = {
-        "type": "FeatureCollection",
-        "features": features
-    }
-
+    # Borough folders are independent, so parse them in parallel processes
+    # and merge the per-route shapes afterwards, in folder order
+    route_shapes = defaultdict(dict)
+    with ProcessPoolExecutor(max_workers=min(len(GTFS_FOLDERS), os.cpu_count() or 1)) as executor:
+        # A failing folder raises here, before routes.geojson is opened, so a
+        # bad feed never overwrites the output with a borough missing
+        for folder_shapes in executor.map(process_folder, GTFS_FOLDERS):
+            for route_id, shapes in folder_shapes.items():
+                for digest, coords in shapes.items():
+                    route_shapes[route_id].setdefault(digest, coords)
+
+    # Write GeoJSON one feature at a time — use MultiLineString to capture all directions
     output_path = 'routes.geojson'
-    with open(output_path, 'w') as f:
-        json.dump(geojson, f)
-
-    print(f"\nDone! {len(features)} routes written to {output_path}")
-    print("Route IDs sample:", sorted([f['properties']['route_id'] for f in features])[:20])
+    with open(output_path, 'wb') as f:
+        f.write(b'{"type":"FeatureCollection","features":[')
+        for i, (route_id, shapes) in enumerate(route_shapes.items()):
+            if i:
+                f.write(b',')
+            f.write(orjson.dumps({
+                "type": "Feature",
+                "properties": {
+                    "route_id": route_id
+                },
+                "geometry": {
+                    "type": "MultiLineString",
+                    "coordinates": list(shapes.values())
+                }
+            }, option=orjson.OPT_SERIALIZE_NUMPY))
+        f.write(b']}')
+
+    print(f"\nDone! {len(route_shapes)} routes written to {output_path}")
+    print("Route IDs sample:", sorted(route_shapes)[:20])
 
 if __name__ == '__main__':
     convert()
@@ -1,11 +1,36 @@
 import json
 import os
+import re
 import requests
 import logging
+from collections import Counter, namedtuple
+from functools import lru_cache
+from itertools import islice
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:  # fall back to stdlib json for local dev
+    orjson = None
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Module-level session so warm Lambda invocations reuse the TLS connection
+SESSION = requests.Session()
+SESSION.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+def json_loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj):
+    # API Gateway expects the body as str, not bytes
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
 # Borough color mapping (blue gradient + purple for express)
 BOROUGH_COLORS = {
     'Manhattan': '#1e40af',
@@ -16,37 +41,98 @@ BOROUGH_COLORS = {
     'Express': '#8b5cf6'
 }
 
+# Route prefix patterns, checked against the upper-cased route name.
+# Express prefixes must be tried first (BXM before BX, SIM before S), and
+# Bx (Bronx local) before single B (Brooklyn)
+EXPRESS_ROUTE_RE = re.compile(r'BXM|QM|BM|SIM|X')
+LOCAL_ROUTE_RE = re.compile(r'BX|M|B|Q|S')
+
+# Agency prefixes stripped from VehicleRef, e.g. "MTA NYCT_7712" -> "7712"
+AGENCY_PREFIX_RE = re.compile(r'^(?:MTA NYCT_|MTABC_|MTA QVC_|MTA BRKLM_|MTA SI_)')
+
+# Shared read-only results, so lookups return a reference instead of a new dict
+BOROUGHS = {
+    name: MappingProxyType({'name': name, 'color': color})
+    for name, color in BOROUGH_COLORS.items()
+}
+UNKNOWN_BOROUGH = MappingProxyType({'name': 'Unknown', 'color': '#6b7280'})
+EXPRESS_BOROUGH = BOROUGHS['Express']
+LOCAL_BOROUGHS = {
+    'BX': BOROUGHS['Bronx'],
+    'M': BOROUGHS['Manhattan'],
+    'B': BOROUGHS['Brooklyn'],
+    'Q': BOROUGHS['Queens'],
+    'S': BOROUGHS['Staten Island']
+}
+
+# Only a few hundred distinct route names exist, so cache the result per name
+@lru_cache(maxsize=1024)
 def get_borough_from_route(route):
-    if not route or len(route) == 0:
-        return {'name': 'Unknown', 'color': '#6b7280'}
+    if not route:
+        return UNKNOWN_BOROUGH
     
     route_upper = route.upper()
     
     # Express routes (all go to their own category)
-    if route_upper.startswith('BXM'):
-        return {'name': 'Express', 'color': '#8b5cf6'}
-    if route_upper.startswith('QM'):
-        return {'name': 'Express', 'color': '#8b5cf6'}
-    if route_upper.startswith('BM'):
-        return {'name': 'Express', 'color': '#8b5cf6'}
-    if route_upper.startswith('SIM'):
-        return {'name': 'Express', 'color': '#8b5cf6'}
-    if route_upper.startswith('X'):
-        return {'name': 'Express', 'color': '#8b5cf6'}
+    if EXPRESS_ROUTE_RE.match(route_upper):
+        return EXPRESS_BOROUGH
     
-    # Check Bx (Bronx local) before single B (Brooklyn)
-    if route_upper.startswith('BX'):
-        return {'name': 'Bronx', 'color': '#2563eb'}
+    # Local routes
+    match = LOCAL_ROUTE_RE.match(route_upper)
+    if match:
+        return LOCAL_BOROUGHS[match.group()]
+    return UNKNOWN_BOROUGH
+
+# Fields pulled out of one SIRI VehicleActivity
+VehicleRow = namedtuple('VehicleRow', [
+    'vehicle_id', 'route', 'latitude', 'longitude', 'destination', 'next_stops', 'borough'
+])
+
+def extract_vehicle(activity):
+    """Return a VehicleRow for one VehicleActivity, or None if it has no location"""
+    # Index the required fields directly; skip vehicles missing any of them
+    try:
+        journey = activity['MonitoredVehicleJourney']
+        location = journey['VehicleLocation']
+        lat = location['Latitude']
+        lon = location['Longitude']
+    except (KeyError, TypeError):
+        return None
+    
+    if not lat or not lon:
+        return None
+    
+    # Bound once, as it is looked up for every optional field below
+    journey_get = journey.get
+    vehicle_ref = journey_get('VehicleRef', 'Unknown')
+    published_line_raw = journey_get('PublishedLineName', '')
+    
+    if isinstance(published_line_raw, list) and len(published_line_raw) > 0:
+        published_line = published_line_raw[0]
+    elif isinstance(published_line_raw, str):
+        published_line = published_line_raw
+    else:
+        published_line = 'Unknown'
+    
+    destination_name = journey_get('DestinationName', 'Unknown')
     
-    # Single letter local routes
-    prefix = route_upper[0]
-    borough_map = {
-        'M': {'name': 'Manhattan', 'color': '#1e40af'},
-        'B': {'name': 'Brooklyn', 'color': '#60a5fa'},
-        'Q': {'name': 'Queens', 'color': '#3b82f6'},
-        'S': {'name': 'Staten Island', 'color': '#93c5fd'}
-    }
-    return borough_map.get(prefix, {'name': 'Unknown', 'color': '#6b7280'})
+    # Extract next stops
+    onward_calls = journey_get('OnwardCalls')
+    if onward_calls:
+        calls = onward_calls.get('OnwardCall', [])
+        next_stops = [call.get('StopPointName', 'Unknown') for call in islice(calls, 3)]
+    else:
+        next_stops = []
+    
+    return VehicleRow(
+        AGENCY_PREFIX_RE.sub('', vehicle_ref, count=1),
+        published_line,
+        lat,
+        lon,
+        destination_name,
+        next_stops,
+        get_borough_from_route(published_line)
+    )
 
 def lambda_handler(event, context):
     """AWS Lambda handler for all NYC buses"""
@@ -59,7 +145,7 @@ def lambda_handler(event, context):
             'headers': {
                 'Content-Type': 'application/json'
             },
-            'body': json.dumps({'error': 'API key not configured'})
+            'body': json_dumps({'error': 'API key not configured'})
         }
     
     try:
@@ -72,74 +158,37 @@ def lambda_handler(event, context):
         }
         
         logger.info(f"Calling {url}")
-        response = requests.get(url, params=params, timeout=90)
-        logger.info(f"Got response with status {response.status_code}")
-        response.raise_for_status()
-        data = response.json()
-        
-        buses = []
-        borough_counts = {}
-        route_counts = {}
+        # Stream the body straight into the JSON parser rather than buffering
+        # it in response.content first; decode_content undoes the gzip encoding
+        with SESSION.get(url, params=params, timeout=90, stream=True) as response:
+            logger.info(f"Got response with status {response.status_code}")
+            response.raise_for_status()
+            data = json_loads(response.raw.read(decode_content=True))
         
         vehicle_activities = data['Siri']['ServiceDelivery']['VehicleMonitoringDelivery'][0].get('VehicleActivity', [])
         
         logger.info(f"Processing {len(vehicle_activities)} vehicles...")
         
-        for activity in vehicle_activities:
-            journey = activity.get('MonitoredVehicleJourney', {})
-            location = journey.get('VehicleLocation', {})
-            lat = location.get('Latitude')
-            lon = location.get('Longitude')
-            
-            if not lat or not lon:
-                continue
-            
-            vehicle_ref = journey.get('VehicleRef', 'Unknown')
-            published_line_raw = journey.get('PublishedLineName', '')
-            
-            if isinstance(published_line_raw, list) and len(published_line_raw) > 0:
-                published_line = published_line_raw[0]
-            elif isinstance(published_line_raw, str):
-                published_line = published_line_raw
-            else:
-                published_line = 'Unknown'
-            
-            destination_name = journey.get('DestinationName', 'Unknown')
-
-            borough_info = get_borough_from_route(published_line)
-            
-            # Track counts
-            borough_name = borough_info['name']
-            if borough_name not in borough_counts:
-                borough_counts[borough_name] = 0
-            borough_counts[borough_name] += 1
-            
-            route_key = f"{borough_name}:{published_line}"
-            if route_key not in route_counts:
-                route_counts[route_key] = 0
-            route_counts[route_key] += 1
-            
-            # Extract next stops
-            next_stops = []
-            onward_calls = journey.get('OnwardCalls', {})
-            if onward_calls:
-                calls = onward_calls.get('OnwardCall', [])
-                for call in calls[:3]:
-                    stop_name = call.get('StopPointName', 'Unknown')
-                    next_stops.append(stop_name)
-            
-            bus_info = {
-                'vehicle_id': vehicle_ref.replace('MTA NYCT_', '').replace('MTABC_', '').replace('MTA QVC_', '').replace('MTA BRKLM_', '').replace('MTA SI_', ''),
-                'route': published_line,
-                'latitude': lat,
-                'longitude': lon,
-                'destination': destination_name,
-                'next_stops': next_stops,
-                'borough': borough_name,
-                'color': borough_info['color']
+        # Extract each vehicle's fields first, then count and build the response
+        # from those rows in separate tight passes
+        rows = [row for row in map(extract_vehicle, vehicle_activities) if row is not None]
+        
+        borough_counts = Counter(row.borough['name'] for row in rows)
+        route_counts = Counter(f"{row.borough['name']}:{row.route}" for row in rows)
+        
+        buses = [
+            {
+                'vehicle_id': row.vehicle_id,
+                'route': row.route,
+                'latitude': row.latitude,
+                'longitude': row.longitude,
+                'destination': row.destination,
+                'next_stops': row.next_stops,
+                'borough': row.borough['name'],
+                'color': row.borough['color']
             }
-            
-            buses.append(bus_info)
+            for row in rows
+        ]
         
         logger.info(f"Returning {len(buses)} buses")
         
@@ -148,7 +197,7 @@ def lambda_handler(event, context):
             'headers': {
                 'Content-Type': 'application/json'
             },
-            'body': json.dumps({
+            'body': json_dumps({
                 'buses': buses,
                 'total_count': len(buses),
                 'borough_counts': borough_counts,
@@ -163,5 +212,5 @@ def lambda_handler(event, context):
             'headers': {
                 'Content-Type': 'application/json'
             },
-            'body': json.dumps({'error': str(e)})
+            'body': json_dumps({'error': str(e)})
         }
\ No newline at end of file
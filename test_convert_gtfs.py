@@ -0,0 +1,44 @@
+import numpy as np
+
+from convert_gtfs import process_folder
+
+SHAPES = (
+    "shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence\n"
+    "S1,40.2,-73.2,2\n"
+    "S1,4x,-73.5,3\n"
+    "S1,40.1,-73.1,1\n"
+)
+
+def write_feed(folder, trips):
+    (folder / 'trips.txt').write_text(trips)
+    (folder / 'shapes.txt').write_text(SHAPES)
+
+def test_trips_without_shape_id_yields_no_shapes(tmp_path):
+    write_feed(tmp_path, "route_id,trip_id\nM15,T1\n")
+    assert process_folder(str(tmp_path)) == {}
+
+def test_malformed_shape_rows_are_skipped(tmp_path):
+    write_feed(tmp_path, "route_id,trip_id,shape_id\nMTA NYCT_Q06,T1,S1\n")
+    route_shapes = process_folder(str(tmp_path))
+    assert list(route_shapes) == ['Q6']
+    [coords] = route_shapes['Q6'].values()
+    np.testing.assert_array_equal(coords, np.array([[-73.1, 40.1], [-73.2, 40.2]], dtype=np.float32))
+
+def test_blank_fields_and_padded_shape_ids(tmp_path):
+    (tmp_path / 'trips.txt').write_text("route_id,trip_id,shape_id\nBX12+,T1,S1\n")
+    (tmp_path / 'shapes.txt').write_text(
+        "shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence\n"
+        " S1 ,40.2,-73.2,2\n"
+        "S1,,-73.5,3\n"
+        "S1,40.1,-73.1,1\n"
+        "S9,40.0,-73.0,1\n"
+    )
+    route_shapes = process_folder(str(tmp_path))
+    assert list(route_shapes) == ['Bx12-SBS']
+    [coords] = route_shapes['Bx12-SBS'].values()
+    np.testing.assert_array_equal(coords, np.array([[-73.1, 40.1], [-73.2, 40.2]], dtype=np.float32))
+
+def test_empty_shapes_file_yields_no_shapes(tmp_path):
+    (tmp_path / 'trips.txt').write_text("route_id,trip_id,shape_id\nM15,T1,S1\n")
+    (tmp_path / 'shapes.txt').write_text("")
+    assert process_folder(str(tmp_path)) == {}
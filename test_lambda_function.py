@@ -0,0 +1,104 @@
+import gzip
+import io
+import json
+
+import pytest
+import requests
+from urllib3 import HTTPResponse
+
+import lambda_function
+from lambda_function import extract_vehicle, get_borough_from_route
+
+def vehicle(line='M15', lat=40.75, lon=-73.98, **journey):
+    journey.setdefault('VehicleRef', 'MTA NYCT_7712')
+    journey['PublishedLineName'] = line
+    journey['VehicleLocation'] = {'Latitude': lat, 'Longitude': lon}
+    return {'MonitoredVehicleJourney': journey}
+
+@pytest.mark.parametrize('route, borough', [
+    ('BXM1', 'Express'),
+    ('bx12', 'Bronx'),
+    ('Bx12', 'Bronx'),
+    ('B41', 'Brooklyn'),
+    ('X27', 'Express'),
+    ('SIM1', 'Express'),
+    ('QM2', 'Express'),
+    ('S79-SBS', 'Staten Island'),
+    ('M15', 'Manhattan'),
+    ('Q44', 'Queens'),
+    ('', 'Unknown'),
+    ('Z1', 'Unknown'),
+])
+def test_get_borough_from_route(route, borough):
+    info = get_borough_from_route(route)
+    assert info['name'] == borough
+    assert info['color'] == lambda_function.BOROUGH_COLORS.get(borough, '#6b7280')
+
+def test_borough_results_are_read_only():
+    with pytest.raises(TypeError):
+        get_borough_from_route('M15')['name'] = 'Queens'
+
+def test_extract_vehicle_skips_missing_location():
+    assert extract_vehicle({'MonitoredVehicleJourney': {'VehicleRef': 'MTA NYCT_1'}}) is None
+    assert extract_vehicle({}) is None
+    assert extract_vehicle(vehicle(lat=0)) is None
+
+def test_extract_vehicle_fields():
+    row = extract_vehicle(vehicle(
+        line=['Bx12'],
+        VehicleRef='MTABC_4321',
+        DestinationName='FORDHAM CENTER',
+        OnwardCalls={'OnwardCall': [
+            {'StopPointName': 'A'}, {}, {'StopPointName': 'C'}, {'StopPointName': 'D'}
+        ]}
+    ))
+    assert row.vehicle_id == '4321'
+    assert row.route == 'Bx12'
+    assert row.destination == 'FORDHAM CENTER'
+    assert row.next_stops == ['A', 'Unknown', 'C']
+    assert row.borough['name'] == 'Bronx'
+
+def test_extract_vehicle_defaults():
+    row = extract_vehicle(vehicle(line=None, VehicleRef='MTA SI_55'))
+    assert row.vehicle_id == '55'
+    assert row.route == 'Unknown'
+    assert row.destination == 'Unknown'
+    assert row.next_stops == []
+
+def test_lambda_handler(monkeypatch):
+    monkeypatch.setenv('MTA_API_KEY', 'test-key')
+    payload = {'Siri': {'ServiceDelivery': {'VehicleMonitoringDelivery': [{'VehicleActivity': [
+        vehicle('M15', VehicleRef='MTA NYCT_1'),
+        vehicle(['M15'], VehicleRef='MTA NYCT_2'),
+        vehicle('BxM1', VehicleRef='MTABC_3'),
+        {'MonitoredVehicleJourney': {'PublishedLineName': 'Q44'}},
+    ]}]}}}
+
+    def fake_get(url, params, timeout, stream):
+        assert stream and params['key'] == 'test-key'
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = HTTPResponse(
+            body=io.BytesIO(gzip.compress(json.dumps(payload).encode())),
+            headers={'Content-Encoding': 'gzip'},
+            status=200,
+            preload_content=False
+        )
+        return response
+
+    monkeypatch.setattr(lambda_function.SESSION, 'get', fake_get)
+    result = lambda_function.lambda_handler({}, None)
+
+    assert result['statusCode'] == 200
+    body = json.loads(result['body'])
+    assert body['total_count'] == 3
+    assert [bus['vehicle_id'] for bus in body['buses']] == ['1', '2', '3']
+    assert body['borough_counts'] == {'Manhattan': 2, 'Express': 1}
+    assert body['route_counts'] == {'Manhattan:M15': 2, 'Express:BxM1': 1}
+    assert body['buses'][2]['color'] == lambda_function.BOROUGH_COLORS['Express']
+
+def test_lambda_handler_without_api_key(monkeypatch):
+    monkeypatch.delenv('MTA_API_KEY', raising=False)
+    result = lambda_function.lambda_handler({}, None)
+    assert result['statusCode'] == 500
+    assert json.loads(result['body']) == {'error': 'API key not configured'}